@@ -1,18 +1,18 @@
 #1 — Install (optional)
 # run in terminal / notebook cell if required
-pip install google-adk google-genai kaggle jupyter-server
+# pip install google-adk google-genai kaggle jupyter-server
 
 
 #2 — Configure Gemini API Key (Kaggle secrets)
-# Kaggle users: retrieve secret and set env var
-import os
-try:
-    from kaggle_secrets import UserSecretsClient
-    GOOGLE_API_KEY = UserSecretsClient().get_secret("GOOGLE_API_KEY")
-    os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
-    print("✅ Gemini API key setup complete.")
-except Exception as e:
-    print("🔑 Authentication Error: Please add 'GOOGLE_API_KEY' to your Kaggle secrets. Details:", e)
+# Kaggle users: retrieve secret and set env var (called from _notebook_main, not at import)
+def configure_api_key():
+    try:
+        from kaggle_secrets import UserSecretsClient
+        GOOGLE_API_KEY = UserSecretsClient().get_secret("GOOGLE_API_KEY")
+        os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+        logger.info("✅ Gemini API key setup complete.")
+    except Exception as e:
+        logger.info("🔑 Authentication Error: Please add 'GOOGLE_API_KEY' to your Kaggle secrets. Details: %s", e)
 
 #3 — Imports (ADK + helpers)
 # core ADK imports
@@ -24,14 +24,54 @@ from google.genai import types
 
 # stdlib & environment
 import os
+import sys
+import atexit
 import asyncio
+import logging
+import shlex
+import functools
 import subprocess
+import logging.handlers
+from queue import SimpleQueue
+import concurrent.futures
+from string import Template
 from IPython.core.display import display, HTML
 
 
 # 4 — Helper: get_adk_proxy_url (Kaggle Notebook / Jupyter)
 # helper to produce the proxied URL and display a clickable button (Kaggle-style)
-def get_adk_proxy_url():
+PROXY_HOST = "https://kkb-production.jupyter-proxy.kaggle.net"
+ADK_PORT = "8000"
+
+# Button markup is fixed; only the URL changes
+ADK_BUTTON_TEMPLATE = Template("""
+<div style="padding: 15px; border: 2px solid #f0ad4e; border-radius: 8px; background-color: #fef9f0; margin: 20px 0;">
+    <div style="font-family: sans-serif; margin-bottom: 12px; color: #333; font-size: 1.1em;">
+        <strong>⚠️ IMPORTANT: Action Required</strong>
+    </div>
+    <div style="font-family: sans-serif; margin-bottom: 15px; color: #333; line-height: 1.5;">
+        The ADK web UI is <strong>not running yet</strong>. You must start it in the next cell.
+        <ol style="margin-top: 10px; padding-left: 20px;">
+            <li style="margin-bottom: 5px;"><strong>Run the next cell</strong> (the one that starts <code>adk web</code>).</li>
+            <li style="margin-bottom: 5px;">Wait for that cell to show it is "Running" (it will not "complete").</li>
+            <li>Once it's running, <strong>return to this button</strong> and click it to open the UI.</li>
+        </ol>
+        <em style="font-size: 0.9em; color: #555;">(If you click the button before starting the web server, you may get an error.)</em>
+    </div>
+    <a href='$url' target='_blank' style="
+        display: inline-block; background-color: #1a73e8; color: white; padding: 10px 20px;
+        text-decoration: none; border-radius: 25px; font-family: sans-serif; font-weight: 500;
+        box-shadow: 0 2px 5px rgba(0,0,0,0.2); transition: all 0.2s ease;">
+        Open ADK Web UI (after running cell below) ↗
+    </a>
+</div>
+""")
+
+
+# The kernel/token in the server base_url are fixed for the life of the kernel,
+# so scan the running servers once and reuse the result.
+@functools.lru_cache(maxsize=1)
+def _adk_proxy_url_prefix():
     # NOTE: this function expects to run inside a Kaggle Notebook/Jupyter env where
     # jupyter_server.serverapp.list_running_servers() returns a base_url with kernel/token.
     try:
@@ -39,9 +79,6 @@ def get_adk_proxy_url():
     except Exception as e:
         raise RuntimeError("jupyter_server import failed. This helper is intended for Kaggle/Jupyter environments.") from e
 
-    PROXY_HOST = "https://kkb-production.jupyter-proxy.kaggle.net"
-    ADK_PORT = "8000"
-
     servers = list(list_running_servers())
     if not servers:
         raise Exception("No running Jupyter servers found. Cannot build proxy URL.")
@@ -54,45 +91,26 @@ def get_adk_proxy_url():
     except IndexError:
         raise Exception(f"Could not parse kernel/token from base URL: {baseURL}")
 
-    url_prefix = f"/k/{kernel}/{token}/proxy/proxy/{ADK_PORT}"
-    url = f"{PROXY_HOST}{url_prefix}"
+    return f"/k/{kernel}/{token}/proxy/proxy/{ADK_PORT}"
 
-    styled_html = f"""
-    <div style="padding: 15px; border: 2px solid #f0ad4e; border-radius: 8px; background-color: #fef9f0; margin: 20px 0;">
-        <div style="font-family: sans-serif; margin-bottom: 12px; color: #333; font-size: 1.1em;">
-            <strong>⚠️ IMPORTANT: Action Required</strong>
-        </div>
-        <div style="font-family: sans-serif; margin-bottom: 15px; color: #333; line-height: 1.5;">
-            The ADK web UI is <strong>not running yet</strong>. You must start it in the next cell.
-            <ol style="margin-top: 10px; padding-left: 20px;">
-                <li style="margin-bottom: 5px;"><strong>Run the next cell</strong> (the one that starts <code>adk web</code>).</li>
-                <li style="margin-bottom: 5px;">Wait for that cell to show it is "Running" (it will not "complete").</li>
-                <li>Once it's running, <strong>return to this button</strong> and click it to open the UI.</li>
-            </ol>
-            <em style="font-size: 0.9em; color: #555;">(If you click the button before starting the web server, you may get an error.)</em>
-        </div>
-        <a href='{url}' target='_blank' style="
-            display: inline-block; background-color: #1a73e8; color: white; padding: 10px 20px;
-            text-decoration: none; border-radius: 25px; font-family: sans-serif; font-weight: 500;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.2); transition: all 0.2s ease;">
-            Open ADK Web UI (after running cell below) ↗
-        </a>
-    </div>
-    """
-    display(HTML(styled_html))
-    return url_prefix
 
-# Quick check
-print("✅ Helper functions ready.")
+def get_adk_proxy_url():
+    url_prefix = _adk_proxy_url_prefix()
+    url = f"{PROXY_HOST}{url_prefix}"
+    display(HTML(ADK_BUTTON_TEMPLATE.substitute(url=url)))
+    return url_prefix
 
 #5 — Configure Retry Options
+# The example prompts run concurrently, so back off exponentially with jitter and a
+# hard cap instead of exp_base=7 (1, 7, 49, 343s...), which retries them in lockstep.
 retry_config = types.HttpRetryOptions(
     attempts=5,        # Maximum retry attempts
-    exp_base=7,        # Delay multiplier
+    exp_base=2,        # Delay multiplier
     initial_delay=1,   # Initial delay before first retry (seconds)
-    http_status_codes=[429, 500, 503, 504]
+    max_delay=30,      # Cap on any single delay (seconds)
+    jitter=1,          # Random extra delay, up to this many seconds
+    http_status_codes=[429, 500, 502, 503, 504, 529]
 )
-print("✅ Retry config set.")
 
 #6 — Define the Agent
 root_agent = Agent(
@@ -106,56 +124,109 @@ root_agent = Agent(
     tools=[google_search],
 )
 
-print("✅ Root Agent defined.")
-
 #7 — Create Runner & Run queries (use asyncio.run in notebook)
 runner = InMemoryRunner(agent=root_agent)
-print("✅ Runner created.")
 
-# async wrapper to call run_debug
+USER_ID = "default"
+
+# Agent and setup output is logged through a queue; a background listener thread writes
+# it to stdout, so concurrent tasks don't block on console I/O and lines stay in order.
+# The listener is only started by _notebook_main; importers configure logging themselves.
+logger = logging.getLogger("adk_agent")
+
+def start_log_listener():
+    if logger.handlers:  # re-running must not add a second handler/listener
+        return
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    log_queue = SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_listener = logging.handlers.QueueListener(log_queue, stdout_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # flush queued lines before the interpreter exits
+
+# async wrapper that streams events as they arrive (run_debug only returns once the whole trace is done)
 async def ask_agent(prompt: str):
-    response = await runner.run_debug(prompt)
-    # response is typically a structure; printing the assistant reply text is common:
-    # ADK's run_debug prints trace; many examples return text in response.result or response[...]
-    # For the notebook trace, you can inspect the object directly.
-    print("\n--- Agent Response Trace ---\n")
-    print(response)  # inspect the returned object in your environment
-
-# Examples: run two example prompts sequentially
+    # One session per prompt, so concurrent prompts don't share conversation history
+    session = await runner.session_service.create_session(app_name=runner.app_name, user_id=USER_ID)
+    message = types.Content(role="user", parts=[types.Part(text=prompt)])
+    async for event in runner.run_async(user_id=USER_ID, session_id=session.id, new_message=message):
+        if not (event.content and event.content.parts):
+            continue
+        # One record per part, so concurrent prompts interleave by line, never mid-line
+        for part in event.content.parts:
+            if part.text and event.is_final_response():
+                logger.info("%s > %s", event.author, part.text)
+            elif part.function_call:
+                logger.info("%s → %s(...)", event.author, part.function_call.name)
+
+# Examples: the two prompts are independent, so run them concurrently
 async def run_examples():
-    await ask_agent("What is Agent Development Kit from Google? What languages is the SDK available in?")
-    await ask_agent("What's the weather in London?")
-
-# execute
-asyncio.run(run_examples())
+    await asyncio.gather(
+        ask_agent("What is Agent Development Kit from Google? What languages is the SDK available in?"),
+        ask_agent("What's the weather in London?"),
+    )
 
 # 8 — Create a sample-agent folder (shell) from Python (same as !adk create ...)
 # Use subprocess to run the adk CLI create command (this creates sample-agent folder)
-import shlex, subprocess
-
-create_cmd = f"adk create sample-agent --model gemini-2.5-flash-lite --api_key {os.environ.get('GOOGLE_API_KEY','')}"
-print("Running:", create_cmd)
-proc = subprocess.run(shlex.split(create_cmd), capture_output=True, text=True)
-print(proc.stdout)
-if proc.stderr:
-    print("STDERR:", proc.stderr)
-  
-#9 — Get proxy URL and start ADK web (non-blocking)
-# Build proxy url prefix (Kaggle/Jupyter only)
-try:
-    url_prefix = get_adk_proxy_url()
-    print("URL prefix:", url_prefix)
-except Exception as e:
-    print("Could not build proxy URL (not in Kaggle/Jupyter?):", e)
-    url_prefix = None
-
-# Start ADK web server non-blocking (will run until stopped). This launches ADK's web UI.
-# NOTE: This command will run the web server and stream logs to stdout - usually you run it in its own terminal.
-if url_prefix:
-    web_cmd = ["adk", "web", "--url_prefix", url_prefix]
-    print("Starting ADK web UI with:", " ".join(web_cmd))
-    # Use Popen so the notebook cell doesn't block. Logs will still appear in the kernel output.
-    web_proc = subprocess.Popen(web_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    print(f"ADK web started (pid={web_proc.pid}). Check kernel output for logs. Open the proxy link displayed above.")
-else:
-    print("ADK web not started (missing url_prefix). If running locally, run: adk web --url_prefix <your_prefix> or simply `adk web`")
+
+# Blocking CLI calls run on a small worker pool so they don't stall the event loop
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+async def create_sample_agent():
+    create_cmd = f"adk create sample-agent --model gemini-2.5-flash-lite --api_key {os.environ.get('GOOGLE_API_KEY','')}"
+    logger.info("Running: %s", create_cmd)
+    loop = asyncio.get_running_loop()
+    try:
+        proc = await loop.run_in_executor(
+            executor,
+            functools.partial(subprocess.run, shlex.split(create_cmd), capture_output=True, text=True, timeout=60),
+        )
+    except subprocess.TimeoutExpired:
+        logger.info("adk create timed out after 60s")
+        return
+    logger.info("%s", proc.stdout)
+    if proc.stderr:
+        logger.info("STDERR: %s", proc.stderr)
+
+# execute: the example prompts and the CLI setup are independent, so overlap them
+async def run_examples_and_setup():
+    await asyncio.gather(run_examples(), create_sample_agent())
+
+# Everything below has side effects (Kaggle secrets, LLM calls, adk CLI, web server), so it
+# only runs as a script / notebook, not when this module is imported for its helpers.
+def _notebook_main():
+    start_log_listener()
+    configure_api_key()
+    logger.info("✅ Helper functions ready.")
+    logger.info("✅ Retry config set.")
+    logger.info("✅ Root Agent defined.")
+    logger.info("✅ Runner created.")
+
+    asyncio.run(run_examples_and_setup())
+
+    #9 — Get proxy URL and start ADK web (non-blocking)
+    # Build proxy url prefix (Kaggle/Jupyter only)
+    try:
+        url_prefix = get_adk_proxy_url()
+        logger.info("URL prefix: %s", url_prefix)
+    except Exception as e:
+        logger.info("Could not build proxy URL (not in Kaggle/Jupyter?): %s", e)
+        url_prefix = None
+
+    # Start ADK web server non-blocking (will run until stopped). This launches ADK's web UI.
+    # NOTE: This command will run the web server and stream logs to stdout - usually you run it in its own terminal.
+    if url_prefix:
+        web_cmd = ["adk", "web", "--url_prefix", url_prefix]
+        logger.info("Starting ADK web UI with: %s", " ".join(web_cmd))
+        # Use Popen so the notebook cell doesn't block. Logs will still appear in the kernel output.
+        web_proc = subprocess.Popen(web_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        logger.info("ADK web started (pid=%s). Check kernel output for logs. Open the proxy link displayed above.", web_proc.pid)
+    else:
+        logger.info("ADK web not started (missing url_prefix). If running locally, run: adk web --url_prefix <your_prefix> or simply `adk web`")
+
+
+if __name__ == "__main__":
+    _notebook_main()
@@ -3,12 +3,12 @@ ADK Multi-Agent Demo
 
 This script reproduces the examples from your notebook:
 - API key setup (Kaggle-friendly)
-- imports (Agent, SequentialAgent, ParallelAgent, LoopAgent, tools)
-- retry options
-- Research + Summarizer coordinator agent
+- imports (Agent, BaseAgent, SequentialAgent, LoopAgent, tools)
+- retry options (jittered exponential backoff)
+- Research + Summarizer coordinator agent (planner fans sub-questions out to parallel researchers)
 - Sequential blog pipeline (outline -> writer -> editor)
-- Parallel research team + aggregator
-- Loop refinement example (writer -> critic -> refiner -> exit function)
+- Parallel research team + aggregator (explicit asyncio fan-out via TrueParallelAgent)
+- Loop refinement example (writer -> combined critique/refine step -> exit on approval or stalled critique)
 
 Usage:
 - Ensure GOOGLE_API_KEY is available in the environment (or Kaggle Secrets)
@@ -17,20 +17,41 @@ Usage:
 Example (in a terminal / notebook cell):
     python adk_multi_agent_demo.py
 
-Note: runner.run_debug calls are async — this script runs them sequentially using asyncio.
+Note: each demo streams events from runner.run_async as they arrive, and the four demos
+run concurrently using asyncio.gather. Set ADK_MAX_PAR to cap how many run at once (default 4).
 """
 
 import os
+import re
+import sys
+import json
+import time
+import random
 import asyncio
+import atexit
+import logging
+import weakref
+import functools
 import subprocess
-from typing import Any, Dict
+import logging.handlers
+from queue import SimpleQueue
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Callable, Dict, Iterable, Optional, Tuple, TypeVar
 
 # ADK imports
-from google.adk.agents import Agent, SequentialAgent, ParallelAgent, LoopAgent
+from google.adk.agents import Agent, BaseAgent, SequentialAgent, LoopAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.context_cache_config import ContextCacheConfig
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.apps import App
+from google.adk.events import Event, EventActions
 from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
 from google.adk.runners import InMemoryRunner
-from google.adk.tools import AgentTool, FunctionTool, google_search
-from google.genai import types
+from google.adk.tools import AgentTool, BaseTool, ToolContext, google_search
+from google import genai
+from google.genai import errors, types
 
 # Optional: Kaggle secret helper (safe if running in Kaggle)
 try:
@@ -38,19 +59,57 @@ try:
 except Exception:
     UserSecretsClient = None
 
+# Optional: orjson for faster JSON encode/decode (falls back to the stdlib json module)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps_sorted(obj: Any) -> str:
+    """Canonical (sorted-key) JSON text for `obj`; non-JSON values are stringified."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS).decode()
+    return json.dumps(obj, sort_keys=True, default=str)
+
+
+def json_loads(text: str) -> Any:
+    """Parse JSON text. Raises ValueError on bad input with either backend."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def strip_json_fence(text: str) -> str:
+    """Remove a ```json ... ``` fence that models sometimes wrap around JSON replies."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    return text
+
 
 # ---------------------------
 # 1. Configure API key
 # ---------------------------
 
+# Set once the Kaggle secret has been fetched, so repeat calls skip the RPC
+_api_key_loaded = False
+
+
 def configure_api_key_from_kaggle():
-    """Try to load GOOGLE_API_KEY from Kaggle secrets (if available) and set ENV var."""
-    if UserSecretsClient is None:
+    """Try to load GOOGLE_API_KEY from Kaggle secrets (if available) and set ENV var.
+
+    Skips the secrets-service round trip when the key is already in the environment
+    or was loaded by an earlier call.
+    """
+    global _api_key_loaded
+    if _api_key_loaded or os.environ.get("GOOGLE_API_KEY") or UserSecretsClient is None:
         return
     try:
         key = UserSecretsClient().get_secret("GOOGLE_API_KEY")
         if key:
             os.environ["GOOGLE_API_KEY"] = key
+            _api_key_loaded = True
             print("✅ Loaded GOOGLE_API_KEY from Kaggle secrets.")
     except Exception as e:
         print("(Kaggle) couldn't read secret:", e)
@@ -58,57 +117,421 @@ def configure_api_key_from_kaggle():
 
 configure_api_key_from_kaggle()
 
+# Agent output goes through a QueueHandler; a background QueueListener thread does
+# the actual stdout writes, so concurrent demos never block on console I/O.
+logger = logging.getLogger("adk_demo")
+if not logger.handlers:  # re-running this code must not add a second handler/listener
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _log_queue: SimpleQueue = SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    _stdout_handler = logging.StreamHandler(sys.stdout)
+    _stdout_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_listener = logging.handlers.QueueListener(_log_queue, _stdout_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+T = TypeVar("T")
+
+
+def per_loop(store: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]", factory: Callable[[], T]) -> T:
+    """Return the object in `store` for the running event loop, creating it with `factory`.
+
+    asyncio locks and semaphores bind to the first loop that contends on them, so a
+    module-level one breaks a second asyncio.run(main()) in the same process.
+    """
+    loop = asyncio.get_running_loop()
+    obj = store.get(loop)
+    if obj is None:
+        obj = store[loop] = factory()
+    return obj
+
+
 # ---------------------------
 # 2. Retry config
 # ---------------------------
-retry_config = types.HttpRetryOptions(
-    attempts=5,
-    exp_base=7,
-    initial_delay=1,
-    http_status_codes=[429, 500, 503, 504],
+RETRY_ATTEMPTS = 5
+RETRY_MAX_DELAY = 30.0  # seconds; hard cap on a single backoff
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+# Requests per minute allowed through to Gemini; tune to your quota
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+
+
+class RateLimiter:
+    """Preemptive gate in front of Gemini calls: a token bucket plus a shared 429 cooldown.
+
+    Every request takes a token before it is sent, smoothing bursts from concurrent
+    agents. After a 429, should_wait() holds back *all* callers until the cooldown
+    ends instead of letting each of them spend a call discovering the limit.
+    """
+
+    def __init__(self, max_rate: int, time_period: float = 60.0):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._tokens = float(max_rate)
+        self._updated = time.monotonic()
+        self._cooldown_until = 0.0
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+    def cooldown(self, seconds: float):
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    async def should_wait(self):
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def acquire(self):
+        async with per_loop(self._locks, asyncio.Lock):
+            await self.should_wait()
+            while True:
+                now = time.monotonic()
+                refill = (now - self._updated) * self.max_rate / self.time_period
+                self._tokens = min(self.max_rate, self._tokens + refill)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.time_period / self.max_rate)
+
+
+gemini_rate_limiter = RateLimiter(GEMINI_RPM)
+
+
+def _retry_after(error: errors.APIError) -> Optional[float]:
+    """Seconds from the Retry-After header of a failed response, if present."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def shared_genai_client() -> genai.Client:
+    """One google-genai client (and so one pooled HTTP connection set) for every agent.
+
+    Created on first use so GOOGLE_API_KEY is read after configure_api_key_from_kaggle().
+    Retries are handled by JitteredGemini, so the client itself doesn't retry.
+    """
+    return genai.Client()
+
+
+class JitteredGemini(Gemini):
+    """Gemini with capped exponential backoff plus random jitter between retries.
+
+    Waits min(2**attempt + uniform(0, 1), RETRY_MAX_DELAY) seconds, so concurrent
+    agents that hit a rate limit together don't all retry at the same instant.
+    A request is only retried if it failed before yielding any response. Each attempt
+    sends a fresh deep copy of the request, since Gemini mutates it in place. Every
+    attempt first passes through gemini_rate_limiter; a 429 puts the limiter into
+    cooldown (Retry-After if given, else the backoff delay) for all callers.
+    All instances share shared_genai_client() instead of opening their own.
+    """
+
+    @property
+    def api_client(self) -> genai.Client:
+        return shared_genai_client()
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        for attempt in range(RETRY_ATTEMPTS):
+            yielded = False
+            await gemini_rate_limiter.acquire()
+            try:
+                request = llm_request.model_copy(deep=True)
+                async for response in super().generate_content_async(request, stream=stream):
+                    yielded = True
+                    yield response
+                return
+            except errors.APIError as e:
+                if yielded or e.code not in RETRY_STATUS_CODES or attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                delay = min(2**attempt + random.uniform(0, 1), RETRY_MAX_DELAY)
+                if e.code == 429:
+                    gemini_rate_limiter.cooldown(_retry_after(e) or delay)
+                else:
+                    await asyncio.sleep(delay)
+
+
+# Gemini context caching, managed by ADK at the App level. ADK caches the system
+# instruction + tools (+ earlier conversation) once a request is large enough to
+# qualify and reuses it for cache_intervals invocations. Each agent's fixed text is
+# its static_instruction, so the state values substituted per call don't change
+# the cache fingerprint (see "Agent instructions" below).
+context_cache_config = ContextCacheConfig(
+    # Gemini rejects explicit caches below this size. Single-turn prompts here stay
+    # under it; requests carrying tool results or loop history are the ones that qualify.
+    min_tokens=1024,
+    ttl_seconds=600,
+    cache_intervals=10,
 )
 
 # Common model factory helper
 def gemini_model(name: str = "gemini-2.5-flash-lite") -> Gemini:
-    return Gemini(model=name, retry_options=retry_config)
+    return JitteredGemini(model=name)
+
+
+# ---------------------------
+# Tool result cache
+# ---------------------------
+
+class ToolResultCache:
+    """LRU + TTL cache of tool results keyed on (tool name, canonical JSON args).
+
+    Plugged into an agent as before_tool_callback / after_tool_callback: a hit
+    returns the stored response and skips the tool call entirely. AgentTool
+    forwards the sub-agent's output_key through the state delta, so that delta
+    is stored and replayed too. google_search is a built-in tool executed by
+    Gemini itself, so it never passes through these callbacks.
+
+    Only tools named in `cacheable` are cached. A tool belongs there only if its
+    result depends on its args alone: an AgentTool whose agent reads {placeholders}
+    from session state would otherwise replay a previous query's answer.
+    """
+
+    def __init__(self, cacheable: Iterable[str], maxsize: int = 512, ttl: float = 600.0):
+        self.cacheable = frozenset(cacheable)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any, Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _key(tool: BaseTool, args: Dict[str, Any]) -> Tuple[str, str]:
+        return tool.name, json_dumps_sorted(args)
+
+    def before_tool(self, tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext) -> Optional[Any]:
+        if tool.name not in self.cacheable:
+            return None
+        key = self._key(tool, args)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, response, state_delta = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        for name, value in state_delta.items():
+            tool_context.state[name] = value
+        return response
+
+    def after_tool(self, tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Any) -> None:
+        if tool.name not in self.cacheable:
+            return None
+        key = self._key(tool, args)
+        self._entries[key] = (time.monotonic(), tool_response, dict(tool_context.actions.state_delta))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return None
+
+
+# ResearchTeam works from its request arg alone. SummarizerAgent is left out: it
+# reads research_findings_* from state, and its request is usually a generic string.
+tool_cache = ToolResultCache(cacheable=["ResearchTeam"])
+
+
+# ---------------------------
+# Agent instructions
+# ---------------------------
+# *_INSTRUCTION is fixed text, passed as static_instruction: it becomes a system
+# instruction that is byte-identical on every call, so it can be context-cached.
+# *_INPUT holds the {placeholders} ADK fills from session state; passed as
+# instruction alongside a static_instruction, it is sent as user content instead,
+# leaving the cached system instruction untouched.
+
+PLANNER_INSTRUCTION = (
+    "You are a research planner. Decompose the user's query into exactly 3 independent sub-questions "
+    "that can be researched separately and together cover the query.\n"
+    "Respond with only a JSON list of 3 strings."
+)
+
+RESEARCH_INSTRUCTION = (
+    "You are a specialized research agent. Your only job is to use the google_search tool "
+    "to find 2-3 pieces of relevant information on the given topic and present the findings with citations."
+)
+
+SUMMARIZER_INSTRUCTION = "Create a concise summary as a bulleted list with 3-5 key points."
+SUMMARIZER_INPUT = "Read the provided research findings: {research_findings_1}\n\n{research_findings_2}\n\n{research_findings_3}"
+
+RESEARCH_COORDINATOR_INSTRUCTION = (
+    "You are a research coordinator. Your goal is to answer the user's query by orchestrating a workflow.\n"
+    "1. First, call the ResearchTeam tool with the user's query to find relevant information.\n"
+    "2. Next, call the SummarizerAgent tool to create a concise summary.\n"
+    "3. Present the final summary clearly to the user as your response."
+)
+
+OUTLINE_INSTRUCTION = (
+    "Create a blog outline for the given topic with:\n"
+    "1. A catchy headline\n2. An introduction hook\n3. 3-5 main sections with 2-3 bullet points for each\n4. A concluding thought"
+)
+
+WRITER_INSTRUCTION = "Write a brief, 200 to 300-word blog post with an engaging and informative tone."
+WRITER_INPUT = "Following this outline strictly: {blog_outline}"
+
+EDITOR_INSTRUCTION = (
+    "Your task is to polish the text by fixing any grammatical errors, improving the flow and sentence structure, and enhancing overall clarity."
+)
+EDITOR_INPUT = "Edit this draft: {blog_draft}"
+
+TECH_RESEARCHER_INSTRUCTION = (
+    "Research the latest AI/ML trends. Include 3 key developments, the main companies involved, and the potential impact. Keep the report very concise (100 words)."
+)
+
+HEALTH_RESEARCHER_INSTRUCTION = (
+    "Research recent medical breakthroughs. Include 3 significant advances, their practical applications, and estimated timelines. Keep the report concise (100 words)."
+)
+
+FINANCE_RESEARCHER_INSTRUCTION = (
+    "Research current fintech trends. Include 3 key trends, their market implications, and the future outlook. Keep the report concise (100 words)."
+)
+
+AGGREGATOR_INSTRUCTION = (
+    "Your summary should highlight common themes, surprising connections, and the most important key takeaways from all three reports. The final summary should be around 200 words."
+)
+AGGREGATOR_INPUT = (
+    "Combine these three research findings into a single executive summary:\n\n"
+    "**Technology Trends:**\n{tech_research}\n\n**Health Breakthroughs:**\n{health_research}\n\n**Finance Innovations:**\n{finance_research}"
+)
+
+INITIAL_WRITER_INSTRUCTION = (
+    "Based on the user's prompt, write the first draft of a short story (around 100-150 words).\n"
+    "Output only the story text, with no introduction or explanation."
+)
+
+STORY_REVISER_INSTRUCTION = (
+    "You are a constructive story critic and refiner. Review the story you are given.\n"
+    "Evaluate the story's plot, characters, and pacing, then respond with a JSON object "
+    'with exactly these keys: {"approved": bool, "critique": str, "story": str}.\n'
+    '- If the story is well-written and complete, set "approved" to true, "critique" to "APPROVED" and "story" to the story unchanged.\n'
+    '- Otherwise, set "approved" to false, put 2-3 specific, actionable suggestions in "critique", '
+    'and put a rewrite of the story that fully incorporates them in "story".'
+)
+STORY_REVISER_INPUT = "Story: {current_story}"
 
 
 # ---------------------------
 # 3. Example: Research + Summarizer Coordinator
 # ---------------------------
+# Each build_* factory is memoized, so re-running a notebook cell reuses the same
+# agent graph (and, through get_runner, the same runner) instead of rebuilding it.
+# build_loop_refinement_pipeline rebuilds automatically when max_iterations changes.
+
+# Number of sub-questions the planner produces and researchers run in parallel.
+# PLANNER_INSTRUCTION and SUMMARIZER_INSTRUCTION are written for 3.
+RESEARCH_FANOUT = 3
+
+
+class SubQuestionPlanner(BaseAgent):
+    """Splits the query into RESEARCH_FANOUT sub-questions stored as sub_question_1..N.
+
+    The wrapped planner replies with a JSON list; each entry gets its own state key so
+    the parallel researchers can reference it as a {placeholder}. Unused slots are set
+    to "" and those researchers skip themselves (see skip_without_sub_question). If the
+    reply can't be parsed, the original query goes to the first researcher only, rather
+    than repeating the same search in every slot.
+    """
+
+    planner: Agent
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, name: str, planner: Agent):
+        super().__init__(name=name, planner=planner, sub_agents=[planner])
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        async for event in self.planner.run_async(ctx):
+            yield event
+
+        query = ""
+        if ctx.user_content and ctx.user_content.parts:
+            query = "".join(part.text or "" for part in ctx.user_content.parts)
+        try:
+            parsed = json_loads(strip_json_fence(str(ctx.session.state.get(self.planner.output_key, ""))))
+        except ValueError:
+            parsed = None
+        sub_questions = [str(q) for q in parsed if q] if isinstance(parsed, list) else []
+        sub_questions = (sub_questions or [query]) + [""] * RESEARCH_FANOUT
+        sub_questions = sub_questions[:RESEARCH_FANOUT]
+
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={f"sub_question_{i}": q for i, q in enumerate(sub_questions, 1)}),
+        )
+
+
+def skip_without_sub_question(index: int) -> Callable[[CallbackContext], Optional[types.Content]]:
+    """before_agent_callback that skips researcher `index` when it has no sub-question.
 
+    Returning content from the callback skips the agent's model call. Its findings key
+    is set to "" so the summarizer's {research_findings_N} placeholders still resolve.
+    """
+
+    def callback(callback_context: CallbackContext) -> Optional[types.Content]:
+        if callback_context.state.get(f"sub_question_{index}"):
+            return None
+        callback_context.state[f"research_findings_{index}"] = ""
+        return types.Content(role="model", parts=[types.Part(text="(no sub-question; skipped)")])
+
+    return callback
+
+
+@functools.lru_cache(maxsize=1)
 def build_research_summarizer_coordinator() -> Agent:
-    research_agent = Agent(
-        name="ResearchAgent",
+    planner_agent = Agent(
+        name="PlannerAgent",
         model=gemini_model(),
-        instruction=(
-            "You are a specialized research agent. Your only job is to use the google_search tool "
-            "to find 2-3 pieces of relevant information on the given topic and present the findings with citations."
+        static_instruction=PLANNER_INSTRUCTION,
+        generate_content_config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=list[str],
         ),
-        tools=[google_search],
-        output_key="research_findings",
+        output_key="sub_questions",
+    )
+
+    # One researcher per sub-question, all running at once
+    researchers = [
+        Agent(
+            name=f"ResearchAgent{i}",
+            model=gemini_model(),
+            static_instruction=RESEARCH_INSTRUCTION,
+            instruction=f"Topic: {{sub_question_{i}}}",
+            tools=[google_search],
+            output_key=f"research_findings_{i}",
+            before_agent_callback=skip_without_sub_question(i),
+        )
+        for i in range(1, RESEARCH_FANOUT + 1)
+    ]
+
+    research_team = SequentialAgent(
+        name="ResearchTeam",
+        description="Researches the given query by splitting it into sub-questions and researching them in parallel.",
+        sub_agents=[
+            SubQuestionPlanner(name="SubQuestionPlanner", planner=planner_agent),
+            TrueParallelAgent(name="ParallelResearchers", sub_agents=researchers),
+        ],
     )
 
     summarizer_agent = Agent(
         name="SummarizerAgent",
         model=gemini_model(),
-        instruction=(
-            "Read the provided research findings: {research_findings}\n"
-            "Create a concise summary as a bulleted list with 3-5 key points."
-        ),
+        static_instruction=SUMMARIZER_INSTRUCTION,
+        instruction=SUMMARIZER_INPUT,
         output_key="final_summary",
     )
 
     root_agent = Agent(
         name="ResearchCoordinator",
         model=gemini_model(),
-        instruction=(
-            "You are a research coordinator. Your goal is to answer the user's query by orchestrating a workflow.\n"
-            "1. First, call the ResearchAgent tool to find relevant information.\n"
-            "2. Next, call the SummarizerAgent tool to create a concise summary.\n"
-            "3. Present the final summary clearly to the user as your response."
-        ),
-        tools=[AgentTool(research_agent), AgentTool(summarizer_agent)],
+        static_instruction=RESEARCH_COORDINATOR_INSTRUCTION,
+        tools=[AgentTool(research_team), AgentTool(summarizer_agent)],
+        before_tool_callback=tool_cache.before_tool,
+        after_tool_callback=tool_cache.after_tool,
     )
 
     return root_agent
@@ -118,32 +541,28 @@ def build_research_summarizer_coordinator() -> Agent:
 # 4. Sequential Blog Pipeline
 # ---------------------------
 
+@functools.lru_cache(maxsize=1)
 def build_sequential_blog_pipeline() -> SequentialAgent:
     outline_agent = Agent(
         name="OutlineAgent",
         model=gemini_model(),
-        instruction=(
-            "Create a blog outline for the given topic with:\n"
-            "1. A catchy headline\n2. An introduction hook\n3. 3-5 main sections with 2-3 bullet points for each\n4. A concluding thought"
-        ),
+        static_instruction=OUTLINE_INSTRUCTION,
         output_key="blog_outline",
     )
 
     writer_agent = Agent(
         name="WriterAgent",
         model=gemini_model(),
-        instruction=(
-            "Following this outline strictly: {blog_outline}\nWrite a brief, 200 to 300-word blog post with an engaging and informative tone."
-        ),
+        static_instruction=WRITER_INSTRUCTION,
+        instruction=WRITER_INPUT,
         output_key="blog_draft",
     )
 
     editor_agent = Agent(
         name="EditorAgent",
         model=gemini_model(),
-        instruction=(
-            "Edit this draft: {blog_draft}\nYour task is to polish the text by fixing any grammatical errors, improving the flow and sentence structure, and enhancing overall clarity."
-        ),
+        static_instruction=EDITOR_INSTRUCTION,
+        instruction=EDITOR_INPUT,
         output_key="final_blog",
     )
 
@@ -154,13 +573,64 @@ def build_sequential_blog_pipeline() -> SequentialAgent:
 # 5. Parallel Research + Aggregator
 # ---------------------------
 
+class TrueParallelAgent(BaseAgent):
+    """Runs every sub-agent in its own asyncio task and yields events as they arrive.
+
+    Concurrency is guaranteed here rather than left to the framework's scheduling.
+    Each sub-agent gets its own branch so they don't see each other's turns; their
+    output_key values reach shared state through the state deltas on the yielded events.
+    A sub-agent waits after each event until the runner has taken it (and appended it
+    to the session), so its next model request sees its own function calls/responses.
+    Per-agent wall times are logged so a serialized run is easy to spot.
+    """
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()  # per-task sentinel
+        timings: Dict[str, float] = {}
+
+        async def drain(sub_agent: BaseAgent):
+            branch = f"{self.name}.{sub_agent.name}"
+            sub_ctx = ctx.model_copy(update={"branch": f"{ctx.branch}.{branch}" if ctx.branch else branch})
+            start = time.perf_counter()
+            try:
+                async for event in sub_agent.run_async(sub_ctx):
+                    consumed = asyncio.Event()
+                    await queue.put((event, consumed))
+                    await consumed.wait()
+            finally:
+                timings[sub_agent.name] = time.perf_counter() - start
+                await queue.put(finished)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(drain(sub_agent)) for sub_agent in self.sub_agents]
+        try:
+            pending = len(tasks)
+            while pending:
+                item = await queue.get()
+                if item is finished:
+                    pending -= 1
+                    continue
+                event, consumed = item
+                yield event
+                # The runner has appended the event by the time the yield returns
+                consumed.set()
+            # Surface any sub-agent failure
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        per_agent = ", ".join(f"{name}={secs:.1f}s" for name, secs in timings.items())
+        logger.info("⏱️ %s: %s (wall %.1fs)", self.name, per_agent, time.perf_counter() - started)
+
+
+@functools.lru_cache(maxsize=1)
 def build_parallel_research_system() -> SequentialAgent:
     tech_researcher = Agent(
         name="TechResearcher",
         model=gemini_model(),
-        instruction=(
-            "Research the latest AI/ML trends. Include 3 key developments, the main companies involved, and the potential impact. Keep the report very concise (100 words)."
-        ),
+        static_instruction=TECH_RESEARCHER_INSTRUCTION,
         tools=[google_search],
         output_key="tech_research",
     )
@@ -168,9 +638,7 @@ def build_parallel_research_system() -> SequentialAgent:
     health_researcher = Agent(
         name="HealthResearcher",
         model=gemini_model(),
-        instruction=(
-            "Research recent medical breakthroughs. Include 3 significant advances, their practical applications, and estimated timelines. Keep the report concise (100 words)."
-        ),
+        static_instruction=HEALTH_RESEARCHER_INSTRUCTION,
         tools=[google_search],
         output_key="health_research",
     )
@@ -178,9 +646,7 @@ def build_parallel_research_system() -> SequentialAgent:
     finance_researcher = Agent(
         name="FinanceResearcher",
         model=gemini_model(),
-        instruction=(
-            "Research current fintech trends. Include 3 key trends, their market implications, and the future outlook. Keep the report concise (100 words)."
-        ),
+        static_instruction=FINANCE_RESEARCHER_INSTRUCTION,
         tools=[google_search],
         output_key="finance_research",
     )
@@ -188,15 +654,12 @@ def build_parallel_research_system() -> SequentialAgent:
     aggregator_agent = Agent(
         name="AggregatorAgent",
         model=gemini_model(),
-        instruction=(
-            "Combine these three research findings into a single executive summary:\n\n"
-            "**Technology Trends:**\n{tech_research}\n\n**Health Breakthroughs:**\n{health_research}\n\n**Finance Innovations:**\n{finance_research}\n\n"
-            "Your summary should highlight common themes, surprising connections, and the most important key takeaways from all three reports. The final summary should be around 200 words."
-        ),
+        static_instruction=AGGREGATOR_INSTRUCTION,
+        instruction=AGGREGATOR_INPUT,
         output_key="executive_summary",
     )
 
-    parallel_team = ParallelAgent(name="ParallelResearchTeam", sub_agents=[tech_researcher, health_researcher, finance_researcher])
+    parallel_team = TrueParallelAgent(name="ParallelResearchTeam", sub_agents=[tech_researcher, health_researcher, finance_researcher])
 
     return SequentialAgent(name="ResearchSystem", sub_agents=[parallel_team, aggregator_agent])
 
@@ -206,48 +669,113 @@ def build_parallel_research_system() -> SequentialAgent:
 # ---------------------------
 
 def exit_loop() -> Dict[str, Any]:
-    """Signal function to exit the loop. The agent must call this when critique == 'APPROVED'."""
+    """Signal payload for leaving the loop. CritRefineAgent emits it when the story is approved."""
     return {"status": "approved", "message": "Story approved. Exiting refinement loop."}
 
 
+def parse_story_review(text: str) -> Dict[str, Any]:
+    """Parse the reviser's JSON reply, tolerating ```json fences. Unparseable replies count as not approved."""
+    text = strip_json_fence(text)
+    try:
+        review = json_loads(text)
+    except ValueError:
+        return {"approved": False, "critique": text, "story": None}
+    if not isinstance(review, dict):
+        return {"approved": False, "critique": text, "story": None}
+    return {
+        "approved": bool(review.get("approved")),
+        "critique": str(review.get("critique", "")),
+        "story": review.get("story") or None,
+    }
+
+
+def critique_similarity(a: str, b: str) -> float:
+    """Token-set Jaccard similarity of two critiques, from 0.0 (disjoint) to 1.0 (same words)."""
+    tokens_a = set(re.findall(r"\w+", a.lower()))
+    tokens_b = set(re.findall(r"\w+", b.lower()))
+    if not tokens_a and not tokens_b:
+        return 1.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class CritRefineAgent(BaseAgent):
+    """Critiques and refines the story in a single model call per loop iteration.
+
+    The wrapped reviser returns {"approved", "critique", "story"} as JSON. Its raw
+    reply is kept only in state (via output_key); this agent's own event carries the
+    story as plain text instead, so the latest story is visible even when the loop
+    ends on max_iterations. Critique/story are copied back into state, and the agent
+    escalates, so the enclosing LoopAgent stops, once the story is approved (with the
+    exit_loop() payload) or once the critique is more than similarity_threshold
+    similar to the previous iteration's, meaning the critic is repeating itself and
+    further rounds are unlikely to help.
+    """
+
+    reviser: Agent
+    similarity_threshold: float = 0.9
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, name: str, reviser: Agent, similarity_threshold: float = 0.9):
+        super().__init__(name=name, reviser=reviser, similarity_threshold=similarity_threshold, sub_agents=[reviser])
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        previous_critique = ctx.session.state.get("critique")
+
+        async for event in self.reviser.run_async(ctx):
+            if event.is_final_response() and event.content:
+                # The JSON reply is already in state via output_key; show the story below instead
+                event = event.model_copy(update={"content": None})
+            yield event
+
+        review = parse_story_review(str(ctx.session.state.get(self.reviser.output_key, "")))
+        state_delta = {"critique": review["critique"]}
+        if review["story"] and not review["approved"]:
+            state_delta["current_story"] = review["story"]
+
+        converged = (
+            not review["approved"]
+            and previous_critique is not None
+            and critique_similarity(str(previous_critique), review["critique"]) > self.similarity_threshold
+        )
+        if converged:
+            logger.info("🔁 %s: critique unchanged since the last iteration, stopping early.", self.name)
+
+        story = review["story"] or str(ctx.session.state.get("current_story", ""))
+        parts = [types.Part(text=story)]
+        if review["approved"]:
+            parts.append(types.Part(text=exit_loop()["message"]))
+        content = types.Content(role="model", parts=parts)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=content,
+            actions=EventActions(state_delta=state_delta, escalate=review["approved"] or converged),
+        )
+
+
+@functools.lru_cache(maxsize=1)
 def build_loop_refinement_pipeline(max_iterations: int = 3) -> SequentialAgent:
     initial_writer_agent = Agent(
         name="InitialWriterAgent",
         model=gemini_model(),
-        instruction=(
-            "Based on the user's prompt, write the first draft of a short story (around 100-150 words).\n"
-            "Output only the story text, with no introduction or explanation."
-        ),
+        static_instruction=INITIAL_WRITER_INSTRUCTION,
         output_key="current_story",
     )
 
-    critic_agent = Agent(
-        name="CriticAgent",
+    reviser_agent = Agent(
+        name="StoryReviserAgent",
         model=gemini_model(),
-        instruction=(
-            "You are a constructive story critic. Review the story provided below.\n"
-            "Story: {current_story}\n\nEvaluate the story's plot, characters, and pacing.\n"
-            "- If the story is well-written and complete, YOU MUST respond with the exact phrase: 'APPROVED'\n"
-            "- Otherwise, provide 2-3 specific, actionable suggestions for improvement."
-        ),
-        output_key="critique",
+        static_instruction=STORY_REVISER_INSTRUCTION,
+        instruction=STORY_REVISER_INPUT,
+        generate_content_config=types.GenerateContentConfig(response_mime_type="application/json"),
+        output_key="story_review",
     )
 
-    refiner_agent = Agent(
-        name="RefinerAgent",
-        model=gemini_model(),
-        instruction=(
-            "You are a story refiner. You have a story draft and critique.\n\n"
-            "Story Draft: {current_story}\nCritique: {critique}\n\n"
-            "Your task is to analyze the critique.\n"
-            "- IF the critique is EXACTLY 'APPROVED', you MUST call the exit_loop function and nothing else.\n"
-            "- OTHERWISE, rewrite the story draft to fully incorporate the feedback from the critique."
-        ),
-        tools=[FunctionTool(exit_loop)],
-        output_key="current_story",  # Overwrite story on each refinement
-    )
+    crit_refine_agent = CritRefineAgent(name="CritRefineAgent", reviser=reviser_agent)
 
-    loop_agent = LoopAgent(name="StoryRefinementLoop", sub_agents=[critic_agent, refiner_agent], max_iterations=max_iterations)
+    loop_agent = LoopAgent(name="StoryRefinementLoop", sub_agents=[crit_refine_agent], max_iterations=max_iterations)
 
     return SequentialAgent(name="StoryPipeline", sub_agents=[initial_writer_agent, loop_agent])
 
@@ -256,32 +784,72 @@ def build_loop_refinement_pipeline(max_iterations: int = 3) -> SequentialAgent:
 # 7. Runner helpers
 # ---------------------------
 
+# Runners keyed by id(agent). Each cached runner holds a reference to its agent,
+# so the id can't be recycled while the entry is alive.
+_runner_cache: Dict[int, InMemoryRunner] = {}
+
+
+def get_runner(agent: Agent) -> InMemoryRunner:
+    """Return a cached InMemoryRunner for `agent`, creating it on first use."""
+    runner = _runner_cache.get(id(agent))
+    if runner is None:
+        app = App(name=agent.name, root_agent=agent, context_cache_config=context_cache_config)
+        runner = _runner_cache[id(agent)] = InMemoryRunner(app=app)
+    return runner
+
+
+# Bounds how many demos hit the shared Gemini backend at once (one semaphore per event loop)
+ADK_MAX_PAR = int(os.getenv("ADK_MAX_PAR", "4"))
+_run_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+USER_ID = "default"
+
+
+def format_event(event: Event) -> Optional[str]:
+    """One-line rendering of an event: final text, or the tool/sub-agent being called."""
+    if not (event.content and event.content.parts):
+        return None
+    lines = []
+    for part in event.content.parts:
+        if part.text and event.is_final_response():
+            lines.append(f"{event.author} > {part.text}")
+        elif part.function_call:
+            lines.append(f"{event.author} → {part.function_call.name}(...)")
+    return "\n".join(lines) or None
+
+
 async def run_agent_and_print(agent: Agent, prompt: str):
-    runner = InMemoryRunner(agent=agent)
-    print(f"\n--- Running agent: {agent.name} ---")
-    response = await runner.run_debug(prompt)
-    # The run_debug call prints traces to stdout; response object may contain full data structure.
-    print("--- run_debug returned: ---")
-    print(response)
-    print(f"--- Finished agent: {agent.name} ---\n")
+    runner = get_runner(agent)
+    # A fresh session per run; run_debug reused one fixed session id
+    session = await runner.session_service.create_session(app_name=runner.app_name, user_id=USER_ID)
+    message = types.Content(role="user", parts=[types.Part(text=prompt)])
+    async with per_loop(_run_semaphores, lambda: asyncio.Semaphore(ADK_MAX_PAR)):
+        logger.info("\n--- Running agent: %s ---", agent.name)
+        # Print each event as soon as it is produced instead of after the whole run
+        async for event in runner.run_async(user_id=USER_ID, session_id=session.id, new_message=message):
+            text = format_event(event)
+            if text:
+                logger.info("[%s] %s", agent.name, text)
+    logger.info("--- Finished agent: %s ---\n", agent.name)
 
 
 async def main():
-    # Example 1: Research Coordinator
+    # Build every pipeline up front; the four demos are independent of each other
     coordinator = build_research_summarizer_coordinator()
-    await run_agent_and_print(coordinator, "What are the latest advancements in quantum computing and what do they mean for AI?")
-
-    # Example 2: Sequential blog pipeline
     blog_pipeline = build_sequential_blog_pipeline()
-    await run_agent_and_print(blog_pipeline, "Write a blog post about the benefits of multi-agent systems for software developers")
-
-    # Example 3: Parallel research + aggregator
     research_system = build_parallel_research_system()
-    await run_agent_and_print(research_system, "Run the daily executive briefing on Tech, Health, and Finance")
-
-    # Example 4: Loop refinement
     loop_pipeline = build_loop_refinement_pipeline(max_iterations=2)
-    await run_agent_and_print(loop_pipeline, "Write a short story about a lighthouse keeper who discovers a mysterious, glowing map")
+
+    await asyncio.gather(
+        # Example 1: Research Coordinator
+        run_agent_and_print(coordinator, "What are the latest advancements in quantum computing and what do they mean for AI?"),
+        # Example 2: Sequential blog pipeline
+        run_agent_and_print(blog_pipeline, "Write a blog post about the benefits of multi-agent systems for software developers"),
+        # Example 3: Parallel research + aggregator
+        run_agent_and_print(research_system, "Run the daily executive briefing on Tech, Health, and Finance"),
+        # Example 4: Loop refinement
+        run_agent_and_print(loop_pipeline, "Write a short story about a lighthouse keeper who discovers a mysterious, glowing map"),
+    )
 
 
 if __name__ == "__main__":